@@ -0,0 +1,202 @@
+"""
+Benchmark log_parser on synthetic TrackerCx logs of any size.
+
+generate_tcx_log writes a log that looks like TrackerCx_cfl_2016-10-31.log:
+* app restarts ("00000-HH:MM:SS-  starting... MM/DD/YYYY") with the session record number starting over
+* midnight crossings, within a session and between restarts
+* wrapped lines: ncu replies on the line after "received from", multi-line socket exception stack traces
+* several ncus talking at once (more than one TCX window), xbee frames, monitor and discovery responses, tasks
+
+Each size is generated once into the work directory and reused.  run_benchmark times the pipeline stages
+(read, type_force and date from the reader's StageProfiler, then get_ncu_connections, find_keyword and plot) and
+compares them with the stored baselines in log_benchmark_baseline.json, which are kept per size and reader options
+(engine, chunk size, compact): a stage is a regression when it is slower than its baseline by more than the tolerance
+and by more than MIN_SLOWDOWN seconds (timer noise on small logs).
+Baselines are only comparable on the machine that recorded them.
+
+Usage:
+python log_benchmark.py                        # 10^4 and 10^5 lines, compared to the baselines
+python log_benchmark.py --sizes 1e6 1e7 --engine mmap
+python log_benchmark.py --update-baseline      # store this run as the new baselines
+python log_benchmark.py --compact              # compact clean_df; also prints its memory report
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import sys
+import tempfile
+
+import matplotlib
+matplotlib.use('Agg')  # plot stage renders to a file, no window
+
+import log_parser
+
+BASELINE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log_benchmark_baseline.json')
+STAGES = ['read', 'type_force', 'date', 'compact', 'get_ncu_connections', 'find_keyword', 'plot']
+MIN_SLOWDOWN = 0.05  # seconds
+GENERATOR_VERSION = 2  # bump when generate_tcx_log changes, so logs generated before are not reused
+KEYWORDS = ['v,0', 'SPC', '0000FFFF,', 'begin()', 'z,ct=']
+
+STACK_TRACE = [
+    'System.Net.Sockets.SocketException (0x80004005): A request to send or receive data was disallowed because '
+    'the socket is not connected and (when sending on a datagram socket using a sendto call) no address was supplied',
+    '   at System.Net.Sockets.Socket.BeginSend(Byte[] buffer, Int32 offset, Int32 size, SocketFlags socketFlags, '
+    'AsyncCallback callback, Object state)',
+    '   at NEXTracker.AsyncSocket.startAsyncSend() in '
+    'C:\\Users\\rtimar\\Source\\Repos\\Tracker_GUI\\Controller\\Net\\ConnectSocket.cs:line 176']
+TASKS = ['EtNCUConfig', 'GetSPCFirmwareTask', 'DiscoverTaskNew', 'PushParamsHopefullyFaster', 'GetNCUConfigTask']
+
+
+def generate_tcx_log(filename, num_lines, num_ncus=4, seed=0):
+    # write a synthetic TrackerCx log of about num_lines lines (it stops after the record that reaches num_lines).
+    # lines are written as they are made, so any size fits in memory
+    rng = random.Random(seed)
+    ncus = ['166.%d.%d.%d' % (rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(num_ncus)]
+    devices = ['40%06X' % rng.randrange(16 ** 6) for _ in range(200)]
+    session_lines = max(num_lines // 5, 1000)  # lines between app restarts
+    start = dt.datetime(2016, 10, 30, 23, 55, 0)
+    clock = start  # the first session runs past midnight (restarts wait for it), however small the log
+
+    with open(filename, 'w') as f:
+        lines_written = 0
+        next_restart = session_lines
+        record_num = 0
+        ncu = ncus[0]
+        while lines_written < num_lines:
+            if record_num == 0:
+                body = ['starting... ' + clock.strftime('%m/%d/%Y')]
+            else:
+                clock += dt.timedelta(seconds=rng.choice([0, 0, 0, 1, 1, 2, 3]))
+                if rng.random() < 0.01:
+                    ncu = rng.choice(ncus)  # another window, or the same window on another ncu
+                body = _make_record(rng, ncu, clock, devices)
+            f.write('%05d-%s-  %s\n' % (record_num, clock.strftime('%H:%M:%S'), '\n'.join(body)))
+            lines_written += len(body)
+            record_num += 1
+
+            if lines_written >= next_restart and clock.date() > start.date():
+                next_restart += session_lines
+                record_num = 0  # restart the app a few hours later
+                clock += dt.timedelta(hours=rng.choice([1, 4, 9]), seconds=rng.randrange(3600))
+
+
+def _make_record(rng, ncu, clock, devices):
+    # lines of one log record (header line text first, then any wrapped lines) with ncu as the peer
+    x = rng.random()
+    if x < 0.25:
+        return ['received from %s:' % ncu, 'v,03000503']
+    if x < 0.45:
+        return ['sent to %s:' % ncu, 'v', '']
+    if x < 0.55:
+        words = ''.join(['%04X' % rng.randrange(16 ** 4) for _ in range(15)])
+        return ['received from %s:' % ncu, '1,0013a200,%s,%04x0317%s' % (rng.choice(devices).lower(),
+                                                                        rng.randrange(2), words.lower())]
+    if x < 0.62:
+        return ['sent to %s:' % ncu, '1,0013A200,%s,0000031700000000' % rng.choice(devices)]
+    if x < 0.66:
+        return ['received from %s:' % ncu, '9,%s,SPCSM2015460%04d,0000,0000' % (rng.choice(devices),
+                                                                           rng.randrange(10000))]
+    if x < 0.72:
+        return ['received from %s:' % ncu, 'z,ct=' + (clock - dt.timedelta(minutes=47)).strftime('%Y/%m/%d/%H/%M/%S')]
+    if x < 0.76:
+        return ['CSocket %s:80 - %s' % (ncu, rng.choice(['init', 'connection attempt : success', 'disconnecting']))]
+    if x < 0.77:
+        return ['CSocket %s:80 - Send error: %s' % (ncu, STACK_TRACE[0])] + STACK_TRACE[1:]
+    if x < 0.80:
+        return ['%s: %s' % (rng.choice(TASKS), rng.choice(['begin()', 'Run()', 'complete called', 'shutdown requested']))]
+    if x < 0.83:
+        return ['sent: 8000031100000000']
+    return [rng.choice(['Borrowed 0, 1 in use.', '1 done, 0 in use.', 'progress bar selected',
+                        'fw cb = COMPLETE_FAILURE, resp='])]
+
+
+def time_stages(filename, **reader_kwargs):
+    # seconds per benchmark stage for one log
+    profiler = log_parser.StageProfiler()
+    reader = log_parser.TCX_TimeLogReader(filename, plot=False, profiler=profiler, **reader_kwargs)
+    with profiler.stage('get_ncu_connections'):
+        reader.get_ncu_connections()
+    with profiler.stage('find_keyword'):
+        for keyword in KEYWORDS:
+            reader.find_keyword(keyword, 'msg')
+    with profiler.stage('plot'):
+        reader.plot_session_history()
+        reader.fig.savefig(os.path.join(tempfile.gettempdir(), 'log_benchmark.png'))
+
+    seconds = {}
+    for x in profiler.stages:
+        stage = x['stage'].split(';')
+        if stage[0] == 'init' and len(stage) == 2:
+            seconds[stage[1]] = seconds.get(stage[1], 0) + x['seconds']
+        elif len(stage) == 1 and stage[0] != 'init':
+            seconds[stage[0]] = x['seconds']
+    if reader.memory_report is not None:
+        print reader.memory_report
+    return {stage: seconds[stage] for stage in STAGES if stage in seconds}, len(reader.clean_df)
+
+
+def baseline_key(size, reader_kwargs):
+    # baselines are kept per size and reader options, e.g. '100000/mmap/None/False'
+    return '%d/%s/%s/%s' % (size, reader_kwargs.get('engine', 'python'), reader_kwargs.get('chunk_size'),
+                            reader_kwargs.get('compact', False))
+
+
+def run_benchmark(sizes, work_dir, tolerance=0.25, update_baseline=False, **reader_kwargs):
+    # time every stage at every size, print them next to their baselines (of the same reader options) and return
+    # the regressions as (size, stage, seconds, baseline seconds)
+    baselines = {}
+    if os.path.exists(BASELINE_FILENAME):
+        with open(BASELINE_FILENAME, 'r') as f:
+            baselines = json.load(f)
+
+    regressions = []
+    for size in sizes:
+        filename = os.path.join(work_dir, 'TrackerCx_bench_%d_v%d.log' % (size, GENERATOR_VERSION))
+        if not os.path.exists(filename):
+            print 'generating %d lines: %s' % (size, filename)
+            generate_tcx_log(filename, size)
+        seconds, num_rows = time_stages(filename, **reader_kwargs)
+        baseline = baselines.get(baseline_key(size, reader_kwargs), {})
+
+        print '%d lines, %d records' % (size, num_rows)
+        for stage in STAGES:
+            if stage not in seconds:
+                continue
+            line = '  %-20s %8.3f s' % (stage, seconds[stage])
+            if stage in baseline:
+                line += '   baseline %8.3f s  %+6.0f%%' % (baseline[stage],
+                                                          100 * (seconds[stage] / baseline[stage] - 1))
+                if seconds[stage] > max(baseline[stage] * (1 + tolerance), baseline[stage] + MIN_SLOWDOWN):
+                    regressions.append((size, stage, seconds[stage], baseline[stage]))
+                    line += '  REGRESSION'
+            print line
+        if update_baseline:
+            baselines[baseline_key(size, reader_kwargs)] = seconds
+
+    if update_baseline:
+        with open(BASELINE_FILENAME, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark log_parser on synthetic TrackerCx logs.')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e4, 1e5], help='log sizes in lines')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'log_benchmark'),
+                        help='where generated logs are kept between runs')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the baselines')
+    parser.add_argument('--engine', default='python', help='TCX_TimeLogReader parser engine')
+    parser.add_argument('--chunk-size', type=int, default=None, help='TCX_TimeLogReader chunk_size')
+    parser.add_argument('--compact', action='store_true', help='TCX_TimeLogReader compact')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.work_dir):
+        os.makedirs(args.work_dir)
+    found = run_benchmark([int(x) for x in args.sizes], args.work_dir, args.tolerance, args.update_baseline,
+                          engine=args.engine, chunk_size=args.chunk_size, compact=args.compact)
+    if found:
+        print '%d stage(s) slower than baseline' % len(found)
+        sys.exit(1)